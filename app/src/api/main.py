@@ -7,24 +7,32 @@ from fastapi import FastAPI, BackgroundTasks
 from fastapi.responses import ORJSONResponse
 from loguru import logger
 from sqlalchemy import select, desc
-from sqlalchemy.ext.asyncio import AsyncSession
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 from src.core.config import settings
-from src.db.session import SessionLocal, init_db
+from src.core.vault import keep_db_lease_alive
+from src.db.session import session, init_db
 from src.db.models import Listing, PriceSnapshot
 from src.scheduler.jobs import job_scrape_city
+from src.scrapers.http import get_client, close_client
 
 app = FastAPI(default_response_class=ORJSONResponse, title="RE Scraper MVP")
 
 # -------- Helpers --------
 async def run_job(coro_fn, *args, **kwargs):
-    async with SessionLocal() as db:  # type: AsyncSession
+    async with session() as db:
         await coro_fn(db, *args, **kwargs)
 
+_LISTING_COLS = [
+    Listing.id, Listing.source, Listing.external_id, Listing.title, Listing.address,
+    Listing.rooms, Listing.area_m2, Listing.floor, Listing.floors_total,
+    Listing.price_rub, Listing.price_per_m2, Listing.url, Listing.active, Listing.updated_at,
+]
+_LISTING_KEYS = [c.key for c in _LISTING_COLS]
+
 async def scheduled_scrape_city():
-    await run_job(job_scrape_city, settings.scrape_city)
+    await run_job(job_scrape_city, get_client(), settings.scrape_city)
 
 # -------- Startup / Scheduler --------
 @app.on_event("startup")
@@ -44,19 +52,30 @@ async def on_startup():
     )
     scheduler.start()
     app.state.scheduler = scheduler
+    app.state.vault_renewer = asyncio.create_task(keep_db_lease_alive())
 
     logger.info(
         f"Scheduler started; added 'scrape_city' every {settings.scrape_interval_min} min "
         f"for city={settings.scrape_city}"
     )
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.scheduler.shutdown(wait=False)
+    app.state.vault_renewer.cancel()
+    try:
+        await app.state.vault_renewer
+    except asyncio.CancelledError:
+        pass
+    await close_client()
+
 # -------- Endpoints --------
 @app.get("/health")
 async def health():
     return {"ok": True}
 
 @app.get("/jobs")
-def list_jobs():
+async def list_jobs():
     jobs = []
     for j in app.state.scheduler.get_jobs():
         jobs.append({
@@ -69,29 +88,21 @@ def list_jobs():
 @app.post("/jobs/scrape/cian")
 async def trigger_cian(background_tasks: BackgroundTasks):
     # Мгновенно пинаем задачу не дожидаясь интервала
-    background_tasks.add_task(run_job, job_scrape_city, settings.scrape_city)
+    background_tasks.add_task(run_job, job_scrape_city, get_client(), settings.scrape_city)
     return {"queued": True}
 
 @app.get("/listings")
 async def list_listings(limit: int = 50):
-    async with SessionLocal() as db:
+    async with session() as db:
+        # только нужные колонки: без гидрации ORM-объектов
         res = await db.execute(
-            select(Listing).order_by(desc(Listing.updated_at)).limit(limit)
+            select(*_LISTING_COLS).order_by(desc(Listing.updated_at)).limit(limit)
         )
-        rows: List[Listing] = res.scalars().all()
-        return [
-            {
-                "id": r.id, "source": r.source, "external_id": r.external_id,
-                "title": r.title, "address": r.address,
-                "rooms": r.rooms, "area_m2": r.area_m2, "floor": r.floor, "floors_total": r.floors_total,
-                "price_rub": r.price_rub, "price_per_m2": r.price_per_m2,
-                "url": r.url, "active": r.active, "updated_at": r.updated_at
-            } for r in rows
-        ]
+        return [dict(zip(_LISTING_KEYS, row)) for row in res.all()]
 
 @app.get("/listings/{listing_id}/history")
 async def price_history(listing_id: int):
-    async with SessionLocal() as db:
+    async with session() as db:
         res = await db.execute(
             select(PriceSnapshot)
             .where(PriceSnapshot.listing_id == listing_id)
@@ -6,6 +6,12 @@ class Settings(BaseSettings):
     db_host: str = "localhost"
     db_port: int = 5432
     db_name: str = "re"
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 1800
+    db_statement_cache_size: int = 1024  # asyncpg
+    db_prepared_statement_cache_size: int = 512  # SQLAlchemy asyncpg dialect
     #db_user: str = "app"
     #db_password: str = "app"
     scrape_city: str = "sankt-petersburg"
@@ -20,6 +26,7 @@ class Settings(BaseSettings):
     cian_exclude_rooms: bool = True
     cian_max_pages: int = 3
     cian_rate_limit_ms: int = 1200
+    cian_concurrency: int = 4
 
     @field_validator("cian_rooms", mode="before")
     @classmethod
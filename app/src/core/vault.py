@@ -1,49 +1,156 @@
-import os, time
-import hvac
+import os, time, json, fcntl, asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+import httpx
 from loguru import logger
 
+# перевыпускаем креды за 10 минут до истечения, продлеваем lease за 15
+REFRESH_BEFORE_S = 600
+RENEW_BEFORE_S = 900
+
+# общий для всех воркеров на хосте кэш lease'а
+CACHE_PATH = Path(os.getenv("VAULT_DB_CACHE", "/run/app/vault_db.json"))
+
 class VaultDBCreds:
-    def __init__(self, lease_id: str, username: str, password: str, lease_duration: int):
+    def __init__(self, lease_id: str, username: str, password: str, lease_duration: int,
+                 obtained_at: float | None = None):
         self.lease_id = lease_id
         self.username = username
         self.password = password
         self.lease_duration = lease_duration
-        self.obtained_at = time.time()
+        self.obtained_at = obtained_at if obtained_at is not None else time.time()
 
     @property
     def ttl_left(self) -> float:
         return self.lease_duration - (time.time() - self.obtained_at)
 
+    def to_dict(self) -> dict:
+        return {
+            "lease_id": self.lease_id,
+            "username": self.username,
+            "password": self.password,
+            "lease_duration": self.lease_duration,
+            "obtained_at": self.obtained_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VaultDBCreds":
+        return cls(**data)
+
 class VaultClient:
     def __init__(self):
+        # никакого I/O при импорте: в Vault ходим только из event loop
         self.addr = os.getenv("VAULT_ADDR", "http://vault:8200")
         self.token = os.getenv("VAULT_TOKEN")
         if not self.token:
             raise RuntimeError("VAULT_TOKEN is not set")
         self.role = os.getenv("VAULT_DB_ROLE", "app-readwrite")
-        self.client = hvac.Client(url=self.addr, token=self.token)
-        if not self.client.is_authenticated():
-            raise RuntimeError("Vault auth failed")
+        self.cache_path = CACHE_PATH
         self._cached: VaultDBCreds | None = None
 
-    def get_db_creds(self) -> VaultDBCreds:
-        # обновляем за 10 минут до истечения
-        if self._cached and self._cached.ttl_left > 600:
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        async with httpx.AsyncClient(
+            base_url=f"{self.addr}/v1/", headers={"X-Vault-Token": self.token}, timeout=10.0
+        ) as client:
+            r = await client.request(method, path, **kwargs)
+        if r.status_code == 403:
+            raise RuntimeError("Vault auth failed")
+        if r.status_code >= 400:
+            raise RuntimeError(f"Vault HTTP {r.status_code} for {path}")
+        return r.json()
+
+    @asynccontextmanager
+    async def _locked(self):
+        # отдельный lock-файл: сам кэш подменяется через rename
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(f"{self.cache_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # flock может ждать другой воркер — не держим на этом event loop
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_cache(self) -> VaultDBCreds | None:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return VaultDBCreds.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning(f"[VAULT] ignoring broken creds cache {self.cache_path}: {e}")
+            return None
+
+    def _write_cache(self, creds: VaultDBCreds) -> None:
+        tmp = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(creds.to_dict(), f)
+        os.rename(tmp, self.cache_path)
+
+    async def get_db_creds(self) -> VaultDBCreds:
+        if self._cached and self._cached.ttl_left > REFRESH_BEFORE_S:
             return self._cached
-        logger.info("[VAULT] fetching dynamic DB creds")
-        path = f"database/creds/{self.role}"
-        resp = self.client.read(path)
-        if not resp or "data" not in resp:
-            raise RuntimeError(f"Vault empty response for {path}")
-        data = resp["data"]
-        lease_id = resp.get("lease_id")
-        lease_duration = resp.get("lease_duration", 3600)
-        self._cached = VaultDBCreds(
-            lease_id=lease_id,
-            username=data["username"],
-            password=data["password"],
-            lease_duration=lease_duration,
-        )
+        async with self._locked():
+            # пока ждали блокировку, другой воркер мог уже получить креды
+            cached = self._read_cache()
+            if cached and cached.ttl_left > REFRESH_BEFORE_S:
+                self._cached = cached
+                return cached
+            logger.info("[VAULT] fetching dynamic DB creds")
+            path = f"database/creds/{self.role}"
+            resp = await self._request("GET", path)
+            if not resp or "data" not in resp:
+                raise RuntimeError(f"Vault empty response for {path}")
+            data = resp["data"]
+            lease_id = resp.get("lease_id")
+            lease_duration = resp.get("lease_duration", 3600)
+            self._cached = VaultDBCreds(
+                lease_id=lease_id,
+                username=data["username"],
+                password=data["password"],
+                lease_duration=lease_duration,
+            )
+            self._write_cache(self._cached)
+        return self._cached
+
+    async def renew_db_lease(self) -> VaultDBCreds | None:
+        # продлеваем именно тот lease, с которым построен движок этого воркера
+        mine = self._cached
+        if mine is None:
+            return None
+        async with self._locked():
+            cached = self._read_cache()
+            same_lease = cached is not None and cached.lease_id == mine.lease_id
+            if same_lease and cached.ttl_left > RENEW_BEFORE_S:
+                # уже продлил другой воркер
+                self._cached = cached
+                return cached
+            if mine.ttl_left > RENEW_BEFORE_S:
+                return mine
+            logger.info(f"[VAULT] renewing lease {mine.lease_id}")
+            resp = await self._request("PUT", "sys/leases/renew", json={"lease_id": mine.lease_id})
+            self._cached = VaultDBCreds(
+                lease_id=resp.get("lease_id") or mine.lease_id,
+                username=mine.username,
+                password=mine.password,
+                lease_duration=resp.get("lease_duration", mine.lease_duration),
+            )
+            # в кэше чужой (более новый) lease — его не затираем
+            if cached is None or same_lease:
+                self._write_cache(self._cached)
         return self._cached
 
 vault_client = VaultClient()
+
+async def keep_db_lease_alive(check_every_s: int = 60) -> None:
+    # продлеваем текущий lease вместо перевыпуска кредов
+    while True:
+        await asyncio.sleep(check_every_s)
+        creds = vault_client._cached
+        if creds is None or creds.ttl_left > RENEW_BEFORE_S:
+            continue
+        try:
+            await vault_client.renew_db_lease()
+        except Exception as e:
+            logger.warning(f"[VAULT] lease renew failed: {e}")
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, BigInteger, Float, Boolean, ForeignKey, Index, DateTime, func
+from sqlalchemy import String, Integer, BigInteger, Float, Boolean, ForeignKey, Index, DateTime, func, text
 
 class Base(DeclarativeBase): pass
 
@@ -23,13 +23,22 @@ class Listing(Base):
     updated_at: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
-        Index("uq_source_ext", "source", "external_id", unique=False),
+        # external_id бывает пустым — уникальность только для заполненных
+        Index("uq_source_ext", "source", "external_id", unique=True,
+              postgresql_where=text("external_id IS NOT NULL")),
+        # ORDER BY updated_at DESC LIMIT в /listings
+        Index("ix_listings_updated_at", "updated_at"),
     )
 
 class PriceSnapshot(Base):
     __tablename__ = "price_snapshots"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    listing_id: Mapped[int] = mapped_column(ForeignKey("listings.id", ondelete="CASCADE"), index=True)
+    listing_id: Mapped[int] = mapped_column(ForeignKey("listings.id", ondelete="CASCADE"))
     ts: Mapped["DateTime"] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
     price_rub: Mapped[int | None] = mapped_column(BigInteger)
     price_per_m2: Mapped[float | None] = mapped_column(Float)
+
+    __table_args__ = (
+        # история цен: WHERE listing_id = ? ORDER BY ts
+        Index("ix_snap_listing_ts", "listing_id", "ts"),
+    )
@@ -1,23 +1,100 @@
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from .models import Base
 from src.core.config import settings
 from src.core.vault import vault_client
 from loguru import logger
 
-def make_dsn():
-    creds = vault_client.get_db_creds()
+# движок создаём лениво, уже внутри event loop (креды из Vault — async)
+engine: AsyncEngine | None = None
+_sessionmaker: async_sessionmaker[AsyncSession] | None = None
+_engine_lock = asyncio.Lock()
+
+async def make_dsn() -> str:
+    creds = await vault_client.get_db_creds()
     user = creds.username
     pwd = creds.password
     host = settings.db_host
     port = settings.db_port
     name = settings.db_name
-    return f"postgresql+asyncpg://{user}:{pwd}@{host}:{port}/{name}"
+    cache = settings.db_prepared_statement_cache_size
+    return f"postgresql+asyncpg://{user}:{pwd}@{host}:{port}/{name}?prepared_statement_cache_size={cache}"
+
+async def _build_engine() -> AsyncEngine:
+    dsn = await make_dsn()
+    return create_async_engine(
+        dsn,
+        echo=False,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+        connect_args={
+            "statement_cache_size": settings.db_statement_cache_size,
+            # короткие точечные запросы: JIT только добавляет время планирования
+            "server_settings": {"jit": "off", "application_name": "re-scraper"},
+        },
+    )
+
+async def get_engine() -> AsyncEngine:
+    global engine
+    if engine is None:
+        async with _engine_lock:
+            if engine is None:
+                engine = await _build_engine()
+    return engine
+
+async def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(await get_engine(), expire_on_commit=False)
+    return _sessionmaker
+
+@asynccontextmanager
+async def session() -> AsyncIterator[AsyncSession]:
+    maker = await get_sessionmaker()
+    async with maker() as db:
+        yield db
+
 
-dsn = make_dsn()
-engine = create_async_engine(dsn, echo=False, pool_pre_ping=True)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+# create_all не трогает индексы уже существующих таблиц — приводим их к models.py сами.
+# Все шаги идемпотентны, на свежей базе ничего не делают.
+_INDEX_DDL = (
+    # uq_source_ext был обычным уникальным индексом без WHERE — под ON CONFLICT ... WHERE
+    # external_id IS NOT NULL нужен частичный
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uq_source_ext'
+                   AND indexdef NOT LIKE '%WHERE%') THEN
+            DROP INDEX uq_source_ext;
+        END IF;
+    END $$
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_source_ext ON listings (source, external_id) "
+    "WHERE external_id IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_listings_updated_at ON listings (updated_at)",
+    "CREATE INDEX IF NOT EXISTS ix_snap_listing_ts ON price_snapshots (listing_id, ts)",
+    # его заменил составной ix_snap_listing_ts
+    "DROP INDEX IF EXISTS ix_price_snapshots_listing_id",
+)
 
+async def _sync_indexes(conn: AsyncConnection) -> None:
+    # воркеры стартуют одновременно — DDL выполняет один, остальные ждут конца его транзакции
+    await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('re-scraper:init_db'))"))
+    for ddl in _INDEX_DDL:
+        await conn.execute(text(ddl))
 
 async def init_db() -> None:
-    async with engine.begin() as conn:
+    async with (await get_engine()).begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        try:
+            await _sync_indexes(conn)
+        except Exception:
+            logger.error("index migration failed — remove duplicate (source, external_id) rows "
+                         "from listings and restart")
+            raise
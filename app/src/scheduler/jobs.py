@@ -1,45 +1,83 @@
-from datetime import datetime
+import asyncio
+import time
+from typing import Dict, List
+import httpx
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.db.models import Listing, PriceSnapshot
 from src.scrapers.cian import fetch_cian
 from src.scrapers.avito import fetch_avito
 
+# строк на один INSERT ... ON CONFLICT
+_UPSERT_CHUNK = 1000
 
-async def upsert_listing(db: AsyncSession, payload: dict) -> None:
-    src = payload["source"]; ext = payload.get("external_id")
-    result = await db.execute(
-        select(Listing).where(Listing.source == src, Listing.external_id == ext)
-    )
-    obj = result.scalar_one_or_none()
-    if obj is None:
-        obj = Listing(**payload)
-        if payload.get("area_m2") and payload.get("price_rub"):
-            obj.price_per_m2 = payload["price_rub"] / payload["area_m2"]
-        db.add(obj)
-        await db.flush()
-        db.add(PriceSnapshot(listing_id=obj.id, price_rub=obj.price_rub, price_per_m2=obj.price_per_m2))
-        logger.info(f"Inserted listing {src}:{ext}")
-    else:
-        changed = False
-        # обновим цену и снимок при изменении
-        new_price = payload.get("price_rub")
-        if new_price and new_price != obj.price_rub:
-            obj.price_rub = new_price
-            obj.price_per_m2 = new_price / (payload.get("area_m2") or obj.area_m2 or 1)
-            db.add(PriceSnapshot(listing_id=obj.id, price_rub=obj.price_rub, price_per_m2=obj.price_per_m2))
-            changed = True
-        # можно обновлять и другие поля
-        if changed:
-            logger.info(f"Updated price for {src}:{ext}")
+async def upsert_listings(db: AsyncSession, payloads: List[Dict]) -> None:
+    if not payloads:
+        return
+    # ON CONFLICT не может обновить одну строку дважды за запрос — схлопываем дубли
+    keyed: Dict[tuple, Dict] = {}
+    no_ext = 0
+    for payload in payloads:
+        if payload.get("external_id") is None:
+            # без external_id частичный уникальный индекс не сработает — строка
+            # вставлялась бы заново на каждом прогоне вместе с новым снимком цены
+            no_ext += 1
+            continue
+        row = dict(payload)
+        if row.get("area_m2") and row.get("price_rub"):
+            row["price_per_m2"] = row["price_rub"] / row["area_m2"]
+        keyed[(row["source"], row["external_id"])] = row
+    if no_ext:
+        logger.warning("upsert: skipped {} items without external_id", no_ext)
+    rows = list(keyed.values())
+    if not rows:
+        return
 
-async def job_scrape_city(db: AsyncSession, city: str):
-    logger.info(f"Run job: scrape city={city} @ {datetime.utcnow().isoformat()}Z")
-    # CIAN
-    for item in await fetch_cian(city):
-        await upsert_listing(db, item)
-    # AVITO
-    for item in await fetch_avito(city):
-        await upsert_listing(db, item)
+    # asyncpg принимает не больше 32767 параметров на запрос (12 на строку) —
+    # шлём пачками в той же транзакции
+    inserted = changed = 0
+    for i in range(0, len(rows), _UPSERT_CHUNK):
+        stmt = insert(Listing).values(rows[i:i + _UPSERT_CHUNK])
+        area = func.coalesce(func.nullif(stmt.excluded.area_m2, 0), func.nullif(Listing.area_m2, 0), 1.0)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Listing.source, Listing.external_id],
+            index_where=Listing.external_id.isnot(None),
+            set_={
+                "price_rub": stmt.excluded.price_rub,
+                "price_per_m2": stmt.excluded.price_rub / area,
+                "updated_at": func.now(),
+            },
+            # обновляем только при изменении цены — тогда строка попадёт в RETURNING
+            where=stmt.excluded.price_rub.isnot(None) & Listing.price_rub.is_distinct_from(stmt.excluded.price_rub),
+        ).returning(
+            Listing.id, Listing.price_rub, Listing.price_per_m2,
+            # xmax = 0 у только что вставленной строки, у обновлённой — нет
+            literal_column("xmax = 0").label("inserted"),
+        )
+
+        # RETURNING отдаёт новые и переоценённые объявления — по каждому пишем снимок цены
+        res = (await db.execute(stmt)).all()
+        changed += len(res)
+        inserted += sum(1 for r in res if r.inserted)
+        snaps = [
+            {"listing_id": r.id, "price_rub": r.price_rub, "price_per_m2": r.price_per_m2}
+            for r in res
+        ]
+        if snaps:
+            await db.execute(insert(PriceSnapshot).values(snaps))
+
+    logger.info("upsert summary: inserted={} updated={} unchanged={}",
+                inserted, changed - inserted, len(rows) - changed)
+
+async def job_scrape_city(db: AsyncSession, http: httpx.AsyncClient, city: str):
+    started = time.monotonic()
+    logger.info("Run job: scrape city={}", city)
+    # площадки независимы — качаем параллельно
+    cian_items, avito_items = await asyncio.gather(fetch_cian(http, city), fetch_avito(http, city))
+    items = cian_items + avito_items
+    # один батч на оба источника — INSERT ... ON CONFLICT пачками в одной транзакции
+    await upsert_listings(db, items)
     await db.commit()
+    logger.info("Job scrape city={} done in {:.1f}s", city, time.monotonic() - started)
@@ -3,25 +3,27 @@ import asyncio
 import httpx
 import re
 import os
-import json
+import orjson
 from pathlib import Path
 from typing import Dict, List, Optional
 from loguru import logger
-from selectolax.parser import HTMLParser
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from selectolax.lexbor import LexborHTMLParser
 from src.core.config import settings
+from src.scrapers.markers import ListingClassifier, has_marker, lowered
 
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
 
 DEBUG_DIR = Path("/app/_debug")
 DEBUG_DIR.mkdir(exist_ok=True, parents=True)
+_DUMP_HTML = os.getenv("DUMP_HTML", "0") == "1"
 
 def _headers() -> Dict[str, str]:
     return {
         "User-Agent": UA,
         "Accept-Language": "ru-RU,ru;q=0.9",
         "Accept": "text/html,application/xhtml+xml",
+        "Accept-Encoding": "br, gzip",
         "Referer": "https://www.avito.ru/",
         "Connection": "keep-alive",
         "Cache-Control": "no-cache",
@@ -34,43 +36,66 @@ ANTI_BOT_MARKERS = [
     "Похоже, вы слишком часто", "Пожалуйста, подождите"
 ]
 
-@retry(reraise=True,
-       stop=stop_after_attempt(4),
-       wait=wait_exponential(multiplier=0.8, min=1, max=8),
-       retry=retry_if_exception_type(FetchError))
-async def _fetch_page(client: httpx.AsyncClient, url: str) -> str:
-    r = await client.get(url, timeout=25.0, follow_redirects=True)
-
-    # сохраняем дамп всегда (для отладки)
-    if os.getenv("DUMP_HTML", "0") == "1":
-        m = re.search(r"[?&]p=(\d+)", str(r.url))
-        p = m.group(1) if m else "1"
-        fname = DEBUG_DIR / f"avito_p{p}.html"
-        try:
-            fname.write_text(r.text, encoding="utf-8")
-            logger.info(f"[AVITO] saved HTML -> {fname}")
-        except Exception as e:
-            logger.warning(f"[AVITO] failed to save HTML: {e}")
+_ANTI_BOT = lowered(ANTI_BOT_MARKERS)
+
+# ретраим только временные ответы; прочие 4xx/5xx сразу ошибка
+_RETRY_STATUSES = {429, 502, 503, 504}
+_MAX_ATTEMPTS = 4
+
+def _retry_delay(r: httpx.Response, attempt: int) -> float:
+    retry_after = r.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), 30.0)
+    return min(8.0, 2.0 ** attempt)
+
+async def _fetch_page(client: httpx.AsyncClient, url: str) -> bytes:
+    for attempt in range(_MAX_ATTEMPTS):
+        r = await client.get(url, headers=_headers(), timeout=25.0, follow_redirects=True)
 
-    if r.status_code >= 400:
+        # дамп для отладки: пишем сырые байты в отдельном потоке, не блокируя event loop
+        if _DUMP_HTML:
+            m = _RE_PAGE.search(str(r.url))
+            p = m.group(1) if m else "1"
+            fname = DEBUG_DIR / f"avito_p{p}.html"
+            try:
+                await asyncio.to_thread(fname.write_bytes, r.content)
+                logger.info(f"[AVITO] saved HTML -> {fname}")
+            except Exception as e:
+                logger.warning(f"[AVITO] failed to save HTML: {e}")
+
+        if r.status_code < 400:
+            break
+        if r.status_code in _RETRY_STATUSES and attempt < _MAX_ATTEMPTS - 1:
+            delay = _retry_delay(r, attempt)
+            logger.warning(f"[AVITO] HTTP {r.status_code} for {url}, retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
         raise FetchError(f"HTTP {r.status_code} for {url}")
 
-    low = r.text.lower()
-    if any(m in low for m in ANTI_BOT_MARKERS) or len(r.text) < 3000:
+    html = r.content
+    if has_marker(html, _ANTI_BOT) or len(html) < 3000:
         logger.warning("[AVITO] anti-bot/short heuristics triggered, trying to parse anyway")
-    return r.text
+    return html
 
 
 # --- Вспомогательные функции ---
+_RE_PAGE = re.compile(r"[?&]p=(\d+)")
+_RE_M2 = re.compile(r"(\d+[.,]?\d*)\s*м²")
+_RE_M2_LATIN = re.compile(r"(\d+[.,]?\d*)\s*m2", re.I)
+_RE_FLOOR = re.compile(r"(\d+)\s*/\s*(\d+)\s*эт", re.I)
+_RE_STUDIO = re.compile(r"\bстуд", re.I)
+_RE_ROOMS = re.compile(r"(\d+)\s*[-–]?\s*к", re.I)
+_RE_LDJSON = re.compile(rb"""<script[^>]*type=["']?application/ld\+json["']?[^>]*>(.*?)</script>""", re.S | re.I)
+
 def _parse_int(text: Optional[str]) -> Optional[int]:
     if not text: return None
-    s = re.sub(r"[^\d]", "", text)
+    s = "".join(filter(str.isdecimal, text))
     return int(s) if s else None
 
 def _parse_float_m2(text: Optional[str]) -> Optional[float]:
     if not text: return None
-    m = re.search(r"(\d+[.,]?\d*)\s*м²", text)
-    if not m: m = re.search(r"(\d+[.,]?\d*)\s*m2", text, flags=re.I)
+    m = _RE_M2.search(text)
+    if not m: m = _RE_M2_LATIN.search(text)
     if not m: return None
     return float(m.group(1).replace(",", "."))
 
@@ -79,36 +104,39 @@ def _price_per_m2(price: Optional[int], area: Optional[float]) -> Optional[float
 
 def _extract_external_id(url: Optional[str]) -> Optional[str]:
     if not url: return None
-    m = re.search(r"/(\d+)(?:\?|$|/)", url)
-    if m: return m.group(1)
+    segs = url.split("?", 1)[0].rstrip("/").split("/")[1:]
+    # обычный вид ссылки: /spb/kvartiry/1-k._kvartira_35m_59et._4012345678 — id в хвосте слага
+    if segs:
+        tail = segs[-1].rpartition("_")[2]
+        if tail.isdecimal(): return tail
+    # запасной вариант: сегмент пути из одних цифр
+    for seg in segs:
+        if seg.isdecimal(): return seg
     return None
 
-def _detect_rent_period(text: str) -> str:
-    low = (text or "").lower()
-    if any(x in low for x in ["в сутки", "за сутки", "/сут", "сутки", "в день", "/день", "за день"]):
-        return "daily"
-    if any(x in low for x in ["в месяц", "в мес", "/мес", "мес.", "месяц"]):
-        return "monthly"
-    return "unknown"
-
-def _is_room_listing(title: str | None, context: str | None) -> bool:
-    t = f"{title or ''} {context or ''}".lower()
-    if "квартира" in t or "студия" in t:
-        return False
-    if "комната в" in t or "комн. в" in t or "в подселени" in t or "подселение" in t:
-        return True
-    if re.search(r"\bкомнат[аеы]\b", t) and "комнатн" not in t:
-        return True
-    return False
-
-def _parse_from_jsonld(html: str) -> List[Dict]:
-    doc = HTMLParser(html)
-    scripts = doc.css('script[type="application/ld+json"]')
+_classify = ListingClassifier(
+    daily=["в сутки", "за сутки", "/сут", "сутки", "в день", "/день", "за день"],
+    monthly=["в месяц", "в мес", "/мес", "мес.", "месяц"],
+    room=["комната в", "комн. в", "в подселени", "подселение"],
+    # "1-комнатная" — не комната
+    room_word_unless=["комнатн"],
+)
+
+def _ldjson_blobs(html: bytes) -> List[bytes | str]:
+    # обычно хватает поиска по байтам — DOM строим только если он ничего не нашёл
+    blobs: List[bytes | str] = [m.group(1) for m in _RE_LDJSON.finditer(html)]
+    if not blobs:
+        doc = LexborHTMLParser(html)
+        # прямой обход <script> дешевле CSS-машинерии
+        blobs = [n.text() for n in doc.tags("script") if n.attributes.get("type") == "application/ld+json"]
+    return blobs
+
+def _parse_from_jsonld(html: bytes) -> List[Dict]:
     out: List[Dict] = []
 
-    for node in scripts:
+    for blob in _ldjson_blobs(html):
         try:
-            data = json.loads(node.text())
+            data = orjson.loads(blob)
         except Exception:
             continue
 
@@ -136,13 +164,14 @@ def _parse_from_jsonld(html: str) -> List[Dict]:
                 ctx = title
                 area_m2 = _parse_float_m2(ctx)
                 floor = floors_total = None
-                mfl = re.search(r"(\d+)\s*/\s*(\d+)\s*эт", ctx, flags=re.I)
+                mfl = _RE_FLOOR.search(ctx)
                 if mfl:
                     floor, floors_total = int(mfl.group(1)), int(mfl.group(2))
                 rooms = None
-                if re.search(r"\bстуд", ctx, flags=re.I): rooms = 0
-                mrooms = re.search(r"(\d+)\s*[-–]?\s*к", ctx, flags=re.I)
+                if _RE_STUDIO.search(ctx): rooms = 0
+                mrooms = _RE_ROOMS.search(ctx)
                 if mrooms: rooms = int(mrooms.group(1))
+                period, is_room = _classify(ctx)
 
                 out.append({
                     "source": "avito",
@@ -156,20 +185,21 @@ def _parse_from_jsonld(html: str) -> List[Dict]:
                     "price_rub": price_rub,
                     "price_per_m2": _price_per_m2(price_rub, area_m2),
                     "url": url,
-                    "_rent_period": "monthly",
-                    "_is_room": _is_room_listing(title, ctx),
+                    # в JSON-LD периода обычно нет — по умолчанию считаем помесячной
+                    "_rent_period": period if period != "unknown" else "monthly",
+                    "_is_room": is_room,
                 })
 
     return [c for c in out if c.get("url")]
 
 
 # --- Основной парсер (JSON-LD приоритет, DOM fallback) ---
-def _parse_cards(html: str) -> List[Dict]:
+def _parse_cards(html: bytes) -> List[Dict]:
     # можно оставить твой старый DOM-парсер как запасной
     return []
 
 # --- Fetch Avito ---
-async def fetch_avito(city: str) -> List[Dict]:
+async def fetch_avito(client: httpx.AsyncClient, city: str) -> List[Dict]:
     base = os.getenv("AVITO_SEARCH_URL")
     if not base:
         logger.warning("[AVITO] AVITO_SEARCH_URL is empty — skip")
@@ -178,25 +208,34 @@ async def fetch_avito(city: str) -> List[Dict]:
     max_pages = max(1, int(os.getenv("AVITO_MAX_PAGES", "1")))
     rate_sleep = int(os.getenv("AVITO_RATE_LIMIT_MS", "1500")) / 1000.0
 
+    # base может прийти как с query-строкой, так и без
+    sep = "&" if "?" in base else "?"
+    sem = asyncio.Semaphore(2)
+
+    async def fetch_one(p: int) -> bytes:
+        # стартуем страницы со сдвигом rate_sleep — та же вежливость, что и при обходе по очереди
+        await asyncio.sleep((p - 1) * rate_sleep)
+        async with sem:
+            url = base if p == 1 else f"{base}{sep}p={p}"
+            logger.info("[AVITO] GET {}", url)
+            return await _fetch_page(client, url)
+
+    htmls = await asyncio.gather(*(fetch_one(p) for p in range(1, max_pages + 1)),
+                                 return_exceptions=True)
+
     items: List[Dict] = []
-    async with httpx.AsyncClient(headers=_headers()) as client:
-        for p in range(1, max_pages + 1):
-            url = base if p == 1 else f"{base}&p={p}"
-            logger.info(f"[AVITO] GET {url}")
-            try:
-                html = await _fetch_page(client, url)
-            except Exception as e:
-                logger.warning(f"[AVITO] fetch failed p={p}: {e}")
-                break
-
-            page_items = _parse_from_jsonld(html)
-            if not page_items:
-                page_items = _parse_cards(html)
-            logger.info(f"[AVITO] parsed {len(page_items)} cards on p={p}")
-            items.extend(page_items)
-            if len(page_items) < 5:
-                break
-            await asyncio.sleep(rate_sleep)
+    for p, html in enumerate(htmls, start=1):
+        if isinstance(html, BaseException):
+            logger.warning("[AVITO] fetch failed p={}: {}", p, html)
+            break
+
+        page_items = _parse_from_jsonld(html)
+        if not page_items:
+            page_items = _parse_cards(html)
+        logger.info("[AVITO] parsed {} cards on p={}", len(page_items), p)
+        items.extend(page_items)
+        if len(page_items) < 5:
+            break
 
     # dedup и фильтры такие же, как у CIAN
     seen = set(); deduped: List[Dict] = []
@@ -208,12 +247,12 @@ async def fetch_avito(city: str) -> List[Dict]:
     if settings.cian_rent_long_only:
         before = len(deduped)
         deduped = [it for it in deduped if it.get("_rent_period") != "daily"]
-        logger.info(f"[AVITO] long-rent filter: kept {len(deduped)}, removed {before - len(deduped)} daily")
+        logger.info("[AVITO] long-rent filter: kept {}, removed {} daily", len(deduped), before - len(deduped))
 
     if settings.cian_exclude_rooms:
         before = len(deduped)
         deduped = [it for it in deduped if not it.get("_is_room")]
-        logger.info(f"[AVITO] rooms filter: kept {len(deduped)}, removed {before - len(deduped)} rooms")
+        logger.info("[AVITO] rooms filter: kept {}, removed {} rooms", len(deduped), before - len(deduped))
 
     filtered: List[Dict] = []
     for it in deduped:
@@ -226,5 +265,5 @@ async def fetch_avito(city: str) -> List[Dict]:
         it.pop("_rent_period", None)
         it.pop("_is_room", None)
 
-    logger.info(f"[AVITO] filtered: {len(filtered)} / parsed: {len(items)}")
+    logger.info("[AVITO] filtered: {} / parsed: {}", len(filtered), len(items))
     return filtered
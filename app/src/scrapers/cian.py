@@ -3,16 +3,21 @@ import httpx
 import math
 import re
 import time
-from typing import Dict, List, Optional
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, ClassVar, Dict, List, Optional
 from loguru import logger
-from selectolax.parser import HTMLParser
+from selectolax.lexbor import LexborHTMLParser, LexborNode
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 from src.core.config import settings
+from src.scrapers.markers import ListingClassifier, has_marker, lowered
 import os
 from pathlib import Path
+from urllib.parse import urlencode
 
 DEBUG_DIR = Path("/app/_debug")
 DEBUG_DIR.mkdir(exist_ok=True, parents=True)
+_DUMP_HTML = os.getenv("DUMP_HTML", "0") == "1"
 
 ANTI_BOT_MARKERS = [
     "вы робот", "подтвердите, что вы не робот", "captcha", "подозрительная активность",
@@ -27,54 +32,61 @@ ROOM_MAP = {
     "1": "1", "2": "2", "3": "3", "4": "4", "5+": "5"
 }
 
-def _detect_rent_period(text: str) -> str:
-    """Возвращает 'monthly' | 'daily' | 'unknown' по текстовым маркерам."""
-    low = (text or "").lower()
-    daily_markers = ["посуточ", "в сутки", "за сутки", "/сут", "сутки", "в день", "/день", "за день"]
-    monthly_markers = ["в месяц", "в мес", "/мес", "мес.", "месяц"]
-    if any(m in low for m in daily_markers):
-        return "daily"
-    if any(m in low for m in monthly_markers):
-        return "monthly"
-    return "unknown"
-
-def _is_room_listing(title: str | None, summary_txt: str | None) -> bool:
-    """
-    Возвращает True, если объявление про комнату (а не про квартиру/студию).
-    Эвристики:
-      - если встречается отдельное слово "комната/комнаты" или фразы "комната в", "в подселении"
-      - и при этом нигде рядом нет "квартира" или "студия"
-    Не цепляем "1-комнатная квартира" (потому что это "комнатнАЯ", а не "комната").
-    """
-    t = f"{title or ''} {summary_txt or ''}".lower()
-
-    # если явно указано "квартира" или "студия" — считаем, что это не комната
-    if "квартира" in t or "студия" in t:
-        return False
-
-    # явные маркеры комнат
-    if re.search(r"\bкомнат[аеы]\b", t):  # "комната", "комнаты"
-        return True
-    if "комната в" in t or "комн. в" in t or "в подселени" in t:
-        return True
-
-    # некоторые карточки пишут "Сдаётся комната ..." — ловим и это
-    if "сдаётся комната" in t or "сдается комната" in t:
-        return True
-
-    return False
+# регулярки карточек компилируем один раз, а не на каждом вызове
+_RE_NONDIGIT = re.compile(r"[^\d]")
+_RE_AREA = re.compile(r"(\d+[,.]?\d*)\s*м²")
+_RE_FLOORS = re.compile(r"(\d+)\s*/\s*(\d+)")
+_RE_ROOMS_COUNT = re.compile(r"(студия|\d+)[-\s]*к", re.IGNORECASE)
+
+_ANTI_BOT = lowered(ANTI_BOT_MARKERS)
+
+_classify = ListingClassifier(
+    daily=["посуточ", "в сутки", "за сутки", "/сут", "сутки", "в день", "/день", "за день"],
+    monthly=["в месяц", "в мес", "/мес", "мес.", "месяц"],
+    # "Сдаётся комната ..." — тоже комната
+    room=["комната в", "комн. в", "в подселени", "сдаётся комната", "сдается комната"],
+)
+
+@dataclass(slots=True)
+class Card:
+    """Карточка выдачи CIAN: поля payload'а плюс служебные признаки для фильтров."""
+    # общий для всех карточек — атрибут класса, а не поле каждого экземпляра
+    source: ClassVar[str] = "cian"
+
+    external_id: Optional[str]
+    title: Optional[str]
+    address: Optional[str]
+    rooms: Optional[int]
+    area_m2: Optional[float]
+    floor: Optional[int]
+    floors_total: Optional[int]
+    price_rub: Optional[int]
+    price_per_m2: Optional[float]
+    url: Optional[str]
+    is_room: bool = False
+    rent_period: str = "unknown"
+
+    def to_payload(self) -> Dict[str, Any]:
+        # служебные признаки наружу не отдаём
+        return {
+            "source": self.source,
+            "external_id": self.external_id,
+            "title": self.title,
+            "address": self.address,
+            "rooms": self.rooms,
+            "area_m2": self.area_m2,
+            "floor": self.floor,
+            "floors_total": self.floors_total,
+            "price_rub": self.price_rub,
+            "price_per_m2": self.price_per_m2,
+            "url": self.url,
+        }
 
 def _parse_int(txt: Optional[str]) -> Optional[int]:
     if not txt: return None
-    nums = re.sub(r"[^\d]", "", txt)
+    nums = _RE_NONDIGIT.sub("", txt)
     return int(nums) if nums else None
 
-def _parse_float(txt: Optional[str]) -> Optional[float]:
-    if not txt: return None
-    txt = txt.replace(",", ".")
-    m = re.search(r"(\d+(?:\.\d+)?)", txt)
-    return float(m.group(1)) if m else None
-
 def _price_per_m2(price: Optional[int], area: Optional[float]) -> Optional[float]:
     if price and area and area > 0:
         return price / area
@@ -90,30 +102,34 @@ def _headers() -> Dict[str, str]:
         "Pragma": "no-cache",
     }
 
-def _build_search_url(page: int) -> str:
-    # Старый стабильный SSR-эндпоинт у CIAN: cat.php с query-параметрами
-    # Пример: https://www.cian.ru/cat.php?deal_type=sale&engine_version=2&offer_type=flat&region=1&room1=1&room2=1&room9=1&p=2
-    params = {
-        "deal_type": settings.cian_deal_type,       # sale|rent
-        "engine_version": "2",
-        "offer_type": settings.cian_offer_type,     # flat
-        "region": str(settings.cian_region_id),     # 1 = Москва
-        "p": str(page),                             # страница
-    }
+_SEARCH_BASE = "https://www.cian.ru/cat.php"
+
+@lru_cache(maxsize=8)
+def _static_query(deal_type: str, offer_type: str, region_id: int, rooms: tuple[str, ...]) -> str:
+    # всё, кроме номера страницы, одинаково для всех страниц скрейпа — собираем один раз
+    params = [
+        ("deal_type", deal_type),        # sale|rent
+        ("engine_version", "2"),
+        ("offer_type", offer_type),      # flat
+        ("region", str(region_id)),      # 1 = Москва
+    ]
     # Комнаты: studio -> room0, 1 -> room1, 2 -> room2, ...
-    room_flags = []
-    for r in settings.cian_rooms:
+    for r in rooms:
         key = None
         if r == "studio": key = "room0"
         elif r == "5+": key = "room5"
         else:
             if r.isdigit(): key = f"room{r}"
         if key:
-            room_flags.append(f"{key}=1")
+            params.append((key, "1"))
+    return urlencode(params)
 
-    base = "https://www.cian.ru/cat.php"
-    query = "&".join([f"{k}={v}" for k,v in params.items()] + room_flags)
-    return f"{base}?{query}"
+def _build_search_url(page: int) -> str:
+    # Старый стабильный SSR-эндпоинт у CIAN: cat.php с query-параметрами
+    # Пример: https://www.cian.ru/cat.php?deal_type=sale&engine_version=2&offer_type=flat&region=1&room1=1&room2=1&room9=1&p=2
+    static = _static_query(settings.cian_deal_type, settings.cian_offer_type,
+                           settings.cian_region_id, tuple(settings.cian_rooms))
+    return f"{_SEARCH_BASE}?{static}&p={page}"
 
 class FetchError(Exception): pass
 
@@ -121,210 +137,265 @@ class FetchError(Exception): pass
        stop=stop_after_attempt(4),
        wait=wait_exponential(multiplier=0.8, min=1, max=10),
        retry=retry_if_exception_type(FetchError))
-async def _fetch_page(client: httpx.AsyncClient, url: str) -> str:
-    r = await client.get(url, timeout=20.0)
-    from loguru import logger
-    logger.debug(f"[CIAN] resp: {r.status_code}, len={len(r.text)} for {r.url}")
+async def _fetch_page(client: httpx.AsyncClient, url: str) -> bytes:
+    r = await client.get(url, headers=_headers(), timeout=20.0)
+    logger.debug("[CIAN] resp: {}, len={} for {}", r.status_code, len(r.content), r.url)
 
-    # если включён дамп
-    if os.getenv("DUMP_HTML", "0") == "1":
+    # дамп для отладки: сырые байты, запись в отдельном потоке, не блокируя event loop
+    if _DUMP_HTML:
         fname = DEBUG_DIR / f"cian_p{r.request.url.params.get('p', '1')}.html"
         try:
-            fname.write_text(r.text, encoding="utf-8")
+            await asyncio.to_thread(fname.write_bytes, r.content)
             logger.info(f"[CIAN] saved HTML -> {fname}")
         except Exception as e:
             logger.warning(f"[CIAN] failed to save HTML: {e}")
 
     # антибот-эвристика
-    low = r.text.lower()
-    if any(m in low for m in ANTI_BOT_MARKERS):
+    html = r.content
+    if has_marker(html, _ANTI_BOT):
         raise FetchError("Anti-bot/verification page detected")
     if r.status_code >= 400:
         raise FetchError(f"HTTP {r.status_code} for {url}")
     # Небольшая защита от антибота: иногда отдают пустую/укороченную страницу
-    if len(r.text) < 5000:
+    if len(html) < 5000:
         raise FetchError("Suspiciously short HTML")
-    return r.text
-
-def _parse_cards(html: str) -> List[Dict]:
-    doc = HTMLParser(html)
-    cards = []
-
-    # Несколько вариантов контейнеров карточек:
-    card_nodes = []
-    for css in [
-        '[data-cian-id]',                                # старый вариант
-        'article[data-name="CardComponent"]',            # частый вариант
-        'div[data-name="CardComponent"]',
-        'div[data-testid="offer-card"]',
-        'div[data-mark="Offer"]',
-    ]:
-        card_nodes.extend(doc.css(css))
-    # dedup
-    seen = set()
-    uniq_nodes = []
-    for n in card_nodes:
-        ident = (n.tag, n.attributes.get("data-cian-id") or n.attributes.get("data-name") or id(n))
-        if ident in seen:
+    return html
+
+# Несколько вариантов контейнеров карточек — от самого частого к редким
+_CARD_SELECTORS = (
+    'article[data-name="CardComponent"]',            # частый вариант
+    'div[data-name="CardComponent"]',
+    '[data-cian-id]',                                # старый вариант
+    'div[data-testid="offer-card"]',
+    'div[data-mark="Offer"]',
+)
+# меньше карточек на странице — считаем её последней
+_MIN_PAGE_CARDS = 5
+# узлы, которые может выбрать _scan_card
+_SCAN_SELECTOR = "[data-mark], [data-testid], [data-name], a[href]"
+
+def _scan_card(card: LexborNode) -> tuple[Dict[str, LexborNode], List[LexborNode]]:
+    """
+    Один обход поддерева карточки вместо css_first на каждый селектор.
+    Для каждого поля берём первый по документу узел самого приоритетного варианта —
+    так же, как цепочка card.css_first(a) or card.css_first(b) or ...
+    Возвращает ({title|link|address|price: узел}, [узлы OfferSummary]).
+    """
+    best: Dict[str, tuple[int, LexborNode]] = {}
+    summary: List[LexborNode] = []
+
+    def offer(field: str, prio: int, node: LexborNode) -> None:
+        cur = best.get(field)
+        if cur is None or prio < cur[0]:
+            best[field] = (prio, node)
+
+    # отбор узлов-кандидатов делает lexbor в C: attributes (dict на узел) строим только для них,
+    # а не для каждого узла карточки
+    for n in card.css(_SCAN_SELECTOR):
+        attrs = n.attributes
+        mark = attrs.get("data-mark")
+        testid = attrs.get("data-testid")
+        name = attrs.get("data-name") or ""
+
+        if mark == "OfferTitle":
+            offer("title", 0, n)
+        elif mark == "OfferSummary":
+            summary.append(n)
+            offer("address", 2, n)
+        elif mark == "MainPrice":
+            # span:has(> span[data-mark="MainPrice"]) больше не нужен: сам MainPrice приоритетнее
+            offer("price", 0, n)
+
+        if testid == "card-title":
+            offer("title", 2, n)
+        elif testid == "address":
+            offer("address", 1, n)
+        elif testid == "price":
+            offer("price", 1, n)
+
+        if name == "GeoLabel":
+            offer("address", 0, n)
+
+        if n.tag == "a":
+            href = attrs.get("href") or ""
+            if "LinkArea" in name:
+                offer("title", 1, n)
+                offer("link", 2, n)
+            if "/sale/" in href:
+                offer("title", 3, n)
+                offer("link", 0, n)
+            if "/rent/" in href:
+                offer("link", 1, n)
+
+    return {field: node for field, (_, node) in best.items()}, summary
+
+def _parse_cards(html: bytes) -> List[Card]:
+    doc = LexborHTMLParser(html)
+    cards: List[Card] = []
+
+    # dedup по data-cian-id, без него — по ссылке на само объявление (ту же, что пойдёт в url):
+    # первая попавшаяся a[href] бывает общей ссылкой на ЖК или агентство
+    uniq_nodes: Dict[str, tuple[LexborNode, Dict[str, LexborNode], List[LexborNode]]] = {}
+    for css in _CARD_SELECTORS:
+        nodes = doc.css(css)
+        if not nodes:
+            continue  # этой разметки на странице нет — пробуем следующий вариант
+        for n in nodes:
+            found, summary_nodes = _scan_card(n)
+            link = found.get("link")
+            href = link.attributes.get("href") if link else None
+            if not href:
+                continue  # без ссылки карточка всё равно отбрасывается
+            key = n.attributes.get("data-cian-id") or href
+            if key not in uniq_nodes:
+                uniq_nodes[key] = (n, found, summary_nodes)
+        # разметка карточек на странице одна — первый сработавший селектор её и нашёл,
+        # остальные варианты полным обходом документа не сканируем
+        break
+
+    for card, found, summary_nodes in uniq_nodes.values():
+
+        # Заголовок (несколько вариантов)
+        title_node = found.get("title")
+        title = title_node.text(strip=True) if title_node else None
+
+        # Ссылка
+        link = found.get("link")
+        url = link.attributes.get("href") if link else None
+        if not url:
             continue
-        seen.add(ident)
-        uniq_nodes.append(n)
-
-    for card in uniq_nodes:
-        try:
-            # Заголовок (несколько вариантов)
-            title_node = (
-                card.css_first('[data-mark="OfferTitle"]')
-                or card.css_first('a[data-name*="LinkArea"]')
-                or card.css_first('[data-testid="card-title"]')
-                or card.css_first('a[href*="/sale/"]')   # fallback
-            )
-            title = title_node.text(strip=True) if title_node else None
-
-            # Ссылка
-            link = (
-                card.css_first("a[href*='/sale/']")
-                or card.css_first("a[href*='/rent/']")
-                or card.css_first('a[data-name*="LinkArea"]')
-            )
-            url = link.attributes.get("href") if link else None
-            if url and url.startswith("//"):
-                url = "https:" + url
-
-            # external_id из ссылки
-            external_id = None
-            if url:
-                m = re.search(r"/(\d+)/?$", url)
-                if m: external_id = m.group(1)
-
-            # Адрес
-            addr_node = (
-                card.css_first('[data-name="GeoLabel"]')
-                or card.css_first('[data-testid="address"]')
-                or card.css_first('[data-mark="OfferSummary"]')
-            )
-            address = addr_node.text(strip=True) if addr_node else None
-
-            # Summary текстом — вытаскиваем площадь и этажи регулярками
-            summary_txt = " ".join(n.text(strip=True) for n in card.css('[data-mark="OfferSummary"]')) or card.text(strip=True)
-            area_m2 = _parse_float(re.search(r"(\d+[,.]?\d*)\s*м²", summary_txt) and re.search(r"(\d+[,.]?\d*)\s*м²", summary_txt).group(0))
-            floor = floors_total = None
-            mfl = re.search(r"(\d+)\s*/\s*(\d+)", summary_txt)
-            if mfl:
-                floor = int(mfl.group(1)); floors_total = int(mfl.group(2))
-
-            # Комнатность
-            rooms = None
-            mrooms = re.search(r"(студия|\d+)[-\s]*к", (title or "") + " " + summary_txt, flags=re.IGNORECASE)
-            if mrooms:
-                rooms = 0 if "студ" in mrooms.group(1).lower() else int(re.search(r"\d+", mrooms.group(1)).group(0))
-
-            # Цена (несколько вариантов селекторов)
-            price_node = (
-                    card.css_first('[data-mark="MainPrice"]')
-                    or card.css_first('[data-testid="price"]')
-                    or card.css_first('span:has(> span[data-mark="MainPrice"])')
-            )
-            price_text = price_node.text(strip=True) if price_node else ""
-            price_rub = _parse_int(price_text) if price_text else None
-
-            # Контекст для определения периода (в т.ч. «в месяц»/«в сутки»)
-            context_txt = " ".join([
-                price_text or "",
-                title or "",
-                summary_txt or "",
-                card.text(strip=True) or "",
-            ])
-
-            rent_period = _detect_rent_period(context_txt)
-            is_room = _is_room_listing(title, summary_txt)
-
-            cards.append({
-                "source": "cian",
-                "external_id": external_id,
-                "title": title,
-                "address": address,
-                "rooms": rooms,
-                "area_m2": area_m2,
-                "floor": floor,
-                "floors_total": floors_total,
-                "price_rub": price_rub,
-                "price_per_m2": _price_per_m2(price_rub, area_m2),
-                "url": url,
-                "_is_room": is_room,
-                "_rent_period": rent_period,  # временно, для фильтрации
-            })
-        except Exception as e:
-            logger.debug(f"[CIAN] card parse error: {e}")
-
-    return [c for c in cards if c.get("url")]
-
-
-async def fetch_cian(city: str) -> List[Dict]:
+        if url.startswith("//"):
+            url = "https:" + url
+
+        # external_id из ссылки
+        # хвостовой числовой сегмент пути — как r"/(\d+)/?$", но без regex
+        tail = url.rstrip("/").rpartition("/")[2]
+        external_id = tail if tail.isdecimal() else None
+
+        # Адрес
+        addr_node = found.get("address")
+        address = addr_node.text(strip=True) if addr_node else None
+
+        # полный текст карточки нужен периоду аренды («Посуточно» бывает бейджем
+        # вне цены, заголовка и summary) — обходим поддерево один раз и переиспользуем
+        card_txt = card.text(strip=True)
+        # Summary текстом — вытаскиваем площадь и этажи регулярками
+        summary_txt = " ".join(n.text(strip=True) for n in summary_nodes) or card_txt
+        marea = _RE_AREA.search(summary_txt)
+        area_m2 = float(marea.group(1).replace(",", ".")) if marea else None
+        floor: Optional[int] = None
+        floors_total: Optional[int] = None
+        mfl = _RE_FLOORS.search(summary_txt)
+        if mfl:
+            floor = int(mfl.group(1)); floors_total = int(mfl.group(2))
+
+        # Комнатность
+        rooms: Optional[int] = None
+        mrooms = _RE_ROOMS_COUNT.search((title or "") + " " + summary_txt)
+        if mrooms:
+            rooms_txt = mrooms.group(1)
+            rooms = 0 if "студ" in rooms_txt.lower() else int(rooms_txt)
+
+        # Цена (несколько вариантов селекторов)
+        price_node = found.get("price")
+        price_text = price_node.text(strip=True) if price_node else ""
+        price_rub = _parse_int(price_text) if price_text else None
+
+        # Контекст для определения периода (в т.ч. «в месяц»/«в сутки»)
+        context_txt = " ".join([price_text or "", title or "", summary_txt or "", card_txt or ""])
+
+        rent_period = _classify.rent_period(context_txt.lower())
+        # комнату определяем только по заголовку и summary: в остальном тексте карточки
+        # встречается "квартира" из описания ЖК и т.п.
+        is_room = _classify.is_room(f"{title or ''} {summary_txt}".lower())
+
+        cards.append(Card(
+            external_id=external_id,
+            title=title,
+            address=address,
+            rooms=rooms,
+            area_m2=area_m2,
+            floor=floor,
+            floors_total=floors_total,
+            price_rub=price_rub,
+            price_per_m2=_price_per_m2(price_rub, area_m2),
+            url=url,
+            is_room=is_room,
+            rent_period=rent_period,
+        ))
+
+    return cards
+
+
+async def fetch_cian(client: httpx.AsyncClient, city: str) -> List[Dict]:
     # city пока не используем — CIAN фильтруем по region_id
     max_pages = max(1, settings.cian_max_pages)
-    out: List[Dict] = []
+    out: List[Card] = []
     rate_sleep = settings.cian_rate_limit_ms / 1000.0
 
-    async with httpx.AsyncClient(headers=_headers(), follow_redirects=True) as client:
-        for p in range(1, max_pages + 1):
+    sem = asyncio.Semaphore(max(1, settings.cian_concurrency))
+
+    async def fetch_one(p: int) -> Optional[List[Card]]:
+        # стартуем страницы со сдвигом rate_sleep — первая волна тоже не уходит пачкой
+        await asyncio.sleep((p - 1) * rate_sleep)
+        async with sem:
             url = _build_search_url(page=p)
             logger.info(f"[CIAN] GET {url}")
             try:
                 html = await _fetch_page(client, url)
             except Exception as e:
                 logger.warning(f"[CIAN] fetch failed p={p}: {e}")
-                break
-
-            items = _parse_cards(html)
-            logger.info(f"[CIAN] parsed {len(items)} cards on p={p}")
-            out.extend(items)
-
-            # эвристика окончания: если карточек мало — выходим
-            if len(items) < 5:
-                break
+                return None
+        items = _parse_cards(html)
+        logger.info(f"[CIAN] parsed {len(items)} cards on p={p}")
+        return items
+
+    pages = await asyncio.gather(*(fetch_one(p) for p in range(1, max_pages + 1)))
+
+    for items in pages:
+        if items is None:
+            break
+        out.extend(items)
+        # эвристика окончания: если карточек мало — дальше не смотрим
+        if len(items) < _MIN_PAGE_CARDS:
+            break
+
+    # dedup и фильтры за один проход, в dict переводим только прошедшие
+    long_only = settings.cian_deal_type == "rent" and settings.cian_rent_long_only
+    exclude_rooms = settings.cian_exclude_rooms
+    min_area = settings.cian_min_area_m2
+    max_price = settings.cian_max_price_rub
 
-            await asyncio.sleep(rate_sleep)
-
-
-    # dedup по (external_id, url)
     seen_ids = set()
-    deduped = []
-    for item in out:
-        key = (item.get("external_id"), item.get("url"))
+    filtered: List[Dict] = []
+    deduped = daily_removed = rooms_removed = 0
+    for card in out:
+        # dedup по (external_id, url)
+        key = (card.external_id, card.url)
         if key in seen_ids:
             continue
         seen_ids.add(key)
-        deduped.append(item)
-
-    # ▶ Фильтр: только долгосрочная аренда (исключаем «посуточно»)
-    if settings.cian_deal_type == "rent" and settings.cian_rent_long_only:
-        before = len(deduped)
-        deduped = [it for it in deduped if it.get("_rent_period") != "daily"]
-        logger.info(f"[CIAN] long-rent filter: {len(deduped)} kept, {before - len(deduped)} daily removed")
-
-    # Удаляем служебное поле перед возвратом
-    for it in deduped:
-        it.pop("_is_room", None)
-        it.pop("_rent_period", None)
-
-    # ▶ Фильтр "только квартиры/студии"
-    if settings.cian_exclude_rooms:
-        before = len(deduped)
-        deduped = [it for it in deduped if not it.get("_is_room")]
-        logger.info(f"[CIAN] rooms filter: kept {len(deduped)}, removed {before - len(deduped)} rooms")
-
-    # ▶ Клиентская фильтрация по площади и цене
-    filtered = []
-    for item in deduped:
-        area_ok = (item.get("area_m2") is not None and item["area_m2"] >= settings.cian_min_area_m2)
-        price_ok = True
-        if settings.cian_max_price_rub is not None:
-            price_ok = (item.get("price_rub") is not None and item["price_rub"] <= settings.cian_max_price_rub)
-        if area_ok and price_ok:
-            filtered.append(item)
-
-    logger.info(f"[CIAN] filtered: {len(filtered)} / parsed: {len(deduped)} "
-                f"(minArea={settings.cian_min_area_m2}, maxPrice={settings.cian_max_price_rub}, longOnly={settings.cian_rent_long_only})")
-    return filtered
+        deduped += 1
 
+        # ▶ Фильтр: только долгосрочная аренда (исключаем «посуточно»)
+        if long_only and card.rent_period == "daily":
+            daily_removed += 1
+            continue
+        # ▶ Фильтр "только квартиры/студии"
+        if exclude_rooms and card.is_room:
+            rooms_removed += 1
+            continue
+        # ▶ Клиентская фильтрация по площади и цене
+        if card.area_m2 is None or card.area_m2 < min_area:
+            continue
+        if max_price is not None and (card.price_rub is None or card.price_rub > max_price):
+            continue
+        filtered.append(card.to_payload())
+
+    if long_only:
+        logger.info(f"[CIAN] long-rent filter: {daily_removed} daily removed")
+    if exclude_rooms:
+        logger.info(f"[CIAN] rooms filter: removed {rooms_removed} rooms")
+    logger.info(f"[CIAN] filtered: {len(filtered)} / parsed: {deduped} "
+                f"(minArea={min_area}, maxPrice={max_price}, longOnly={settings.cian_rent_long_only})")
+    return filtered
@@ -0,0 +1,22 @@
+import httpx
+
+# один клиент на процесс, как и движок БД: TLS/DNS к площадкам не переустанавливаются
+# на каждый прогон, страницы одной площадки мультиплексируются по HTTP/2
+_client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+            timeout=25.0,
+        )
+    return _client
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,52 @@
+import re
+from typing import Iterable
+
+def lowered(words: Iterable[str]) -> tuple[str, ...]:
+    # маркеры приводим к нижнему регистру один раз, при импорте скрейпера
+    return tuple(w.lower() for w in words)
+
+def has_marker(html: bytes, markers: tuple[str, ...]) -> bool:
+    """Есть ли на странице хоть один маркер из lowered(), без учёта регистра (в т.ч. кириллицы)."""
+    # decode + lower и буквальный поиск `in` быстрее регулярки с (?:x|X) на каждую букву
+    low = html.decode("utf-8", "replace").lower()
+    return any(m in low for m in markers)
+
+_RE_ROOM_WORD = re.compile(r"\bкомнат[аеы]\b")
+
+class ListingClassifier:
+    """
+    Период аренды и «комната или квартира» по тексту карточки: один lower() на карточку,
+    дальше буквальные `in` — без регулярки-альтернации, которая съедала бы перекрывающиеся
+    маркеры ("комната в день": "в" нужен и комнате, и периоду).
+    """
+
+    def __init__(self, daily: Iterable[str], monthly: Iterable[str], room: Iterable[str],
+                 room_word_unless: Iterable[str] = ()):
+        self.daily = lowered(daily)
+        self.monthly = lowered(monthly)
+        self.room = lowered(room)
+        # при этих маркерах отдельное слово "комната/комнаты" комнатой не считаем
+        self.room_word_unless = lowered(room_word_unless)
+
+    def rent_period(self, low: str) -> str:
+        """'daily' | 'monthly' | 'unknown' по уже приведённому к lower() тексту."""
+        if any(m in low for m in self.daily):
+            return "daily"
+        if any(m in low for m in self.monthly):
+            return "monthly"
+        return "unknown"
+
+    def is_room(self, low: str) -> bool:
+        """Комната, а не квартира/студия — по уже приведённому к lower() тексту."""
+        # явно указано "квартира" или "студия" — это не комната
+        if "квартира" in low or "студия" in low:
+            return False
+        if any(m in low for m in self.room):
+            return True
+        return (_RE_ROOM_WORD.search(low) is not None
+                and not any(m in low for m in self.room_word_unless))
+
+    def __call__(self, text: str | None) -> tuple[str, bool]:
+        """('daily' | 'monthly' | 'unknown', это комната?) по одному и тому же тексту."""
+        low = (text or "").lower()
+        return self.rent_period(low), self.is_room(low)